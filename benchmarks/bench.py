@@ -0,0 +1,228 @@
+import argparse
+import importlib
+import json
+import os
+import platform
+import pty
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from ruv.models import ProgramDetails, Overview, Schedule
+from ruv.mockapi import MockServer, SYNTHETIC_ID, synthetic_program, synthetic_schedule, synthetic_overview
+
+# ruv.choose is shadowed by the partial of the same name in ruv/__init__.py
+choose = importlib.import_module('ruv.choose')
+
+# Timings only compare on the machine that made them, so the baseline is kept
+# out of version control and tagged with the machine it was recorded on
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+MACHINE = f'{platform.node()} {platform.machine()} {platform.python_implementation()} {platform.python_version()}'
+MODEL_SIZES = (10, 100, 1000, 5000)
+LAYOUT_SIZES = (10, 1000, 100000)
+WIDTHS = (40, 80, 200)
+ROWS = 50
+ALT_SCREEN = b'\x1b[?1049h'
+
+
+class HeadlessWindow:
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+
+    def getmaxyx(self):
+        return self.rows, self.cols
+
+    def getch(self):
+        return ord('q')
+
+    def _noop(self, *args):
+        pass
+
+    addstr = erase = refresh = box = border = attron = attroff = move = clrtoeol = timeout = _noop
+
+
+class HeadlessSession:
+    active = True
+
+    def __init__(self, rows, cols):
+        self.screen = HeadlessWindow(rows, cols)
+
+    def show_messages(self):
+        pass
+
+    def clear_messages(self):
+        pass
+
+
+def headless():
+    choose.curses.newwin = lambda rows, cols, y, x: HeadlessWindow(rows, cols)
+    choose.COLORS.normal = choose.COLORS.highlight = choose.COLORS.title = 0
+
+
+def model_benchmarks():
+    for size in MODEL_SIZES:
+        details = synthetic_program(SYNTHETIC_ID, size)
+        yield f'models.ProgramDetails[{size}]', lambda: ProgramDetails(details)
+        overview = synthetic_overview(max(size // 10, 1))
+        yield f'models.Overview[{size}]', lambda: Overview(overview)
+        schedule = synthetic_schedule('ruv', '2020-01-01', events=size)
+        yield f'models.Schedule[{size}]', lambda: Schedule(schedule)
+
+
+def layout_benchmarks():
+    headless()
+    episodes = ProgramDetails(synthetic_program(SYNTHETIC_ID, max(LAYOUT_SIZES))).episodes
+    texts = [ep.display() for ep in episodes]
+    for size in LAYOUT_SIZES:
+        for width in WIDTHS:
+            window = HeadlessWindow(ROWS, width)
+            yield f'choose.wrap[{size}x{width}]', lambda: [choose.wrap(t, width, max_lines=3) for t in texts[:size]]
+            yield f'choose.Line[{size}x{width}]', lambda: [choose.Line(window, t, width, None) for t in texts[:size]]
+            display = choose.ListDisplay(texts[:size], HeadlessSession(ROWS, width + 2), 'Title')
+            yield f'ListDisplay._paginate[{size}x{width}]', display._paginate
+
+
+class CommandFailed(Exception):
+    pass
+
+
+def run_command(argv, env, chooser=True):
+    start = time.perf_counter()
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execvpe(sys.executable, [sys.executable, '-c', 'import ruv; ruv.main()', *argv], env)
+    output = b''
+    sent = False
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except OSError:
+            break
+        if not data:
+            break
+        output += data
+        if not sent and ALT_SCREEN in output:
+            # The chooser is up; quit it as soon as it has drawn
+            os.write(fd, b'q')
+            sent = True
+    _, status = os.waitpid(pid, 0)
+    os.close(fd)
+    elapsed = time.perf_counter() - start
+    # A command that crashes early would otherwise be recorded as a fast run
+    code = os.waitstatus_to_exitcode(status)
+    if code != 0:
+        raise CommandFailed(f'ruv {" ".join(argv)} exited with status {code}:\n{output.decode(errors="replace")[-2000:]}')
+    if chooser and not sent:
+        raise CommandFailed(f'ruv {" ".join(argv)} never showed the chooser:\n{output.decode(errors="replace")[-2000:]}')
+    return elapsed
+
+
+def end_to_end_benchmarks():
+    server = MockServer(latency=0.02).start()
+    # A fresh home, so that neither the user's config nor their caches and
+    # catalog snapshot affect the results
+    home = tempfile.TemporaryDirectory()
+    pythonpath = os.pathsep.join(filter(None, [str(ROOT), os.environ.get('PYTHONPATH')]))
+    env = dict(os.environ, PYTHONPATH=pythonpath, HOME=home.name, XDG_CACHE_HOME=os.path.join(home.name, '.cache'),
+            TERM='xterm', **server.environ)
+    commands = {
+        'e2e.search': (['-p', 'true', 'search', 'synthetic'], True),
+        'e2e.search --play': (['-p', 'true', 'search', 'synthetic', '--play'], False),
+        'e2e.schedule': (['schedule'], True),
+    }
+    with home:
+        for name, (argv, chooser) in commands.items():
+            yield name, lambda: run_command(argv, env, chooser)
+
+
+SUITES = {
+    'models': model_benchmarks,
+    'layout': layout_benchmarks,
+    'e2e': end_to_end_benchmarks,
+}
+
+
+def measure(func, repeat):
+    # Each run loops for at least 0.2 seconds, so that fast benchmarks are not
+    # dominated by timer resolution, and the median of the runs is reported so
+    # that a single run disturbed by the rest of the system does not count
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return statistics.median(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baseline():
+    if not BASELINE_PATH.exists():
+        print('No baseline yet, run with --save to record one for this machine')
+        return {}
+    saved = json.loads(BASELINE_PATH.read_text())
+    if saved.get('machine') != MACHINE:
+        print(f"The baseline in '{BASELINE_PATH}' was recorded on another machine, run with --save to replace it")
+        return {}
+    return saved['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for ruv', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('suites', metavar='SUITE', nargs='*', default=list(SUITES), help=f'Suites to run. Choose from: {", ".join(SUITES)}')
+    parser.add_argument('-k', '--filter', help='Only run benchmarks whose name contains this string', default='')
+    parser.add_argument('-r', '--repeat', type=int, default=7, help='Runs per benchmark, the median one is reported')
+    parser.add_argument('-t', '--threshold', type=float, default=0.25, help='Allowed slowdown relative to the baseline before failing')
+    parser.add_argument('--e2e-threshold', type=float, default=0.5,
+            help='Allowed slowdown for the end to end benchmarks, which include process start up and network latency')
+    parser.add_argument('--confirm', type=int, default=2, help='Times a slowdown is measured again before it is reported')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline')
+    args = parser.parse_args()
+
+    baseline = load_baseline()
+    results = {}
+    regressions = []
+    failures = []
+    for suite in args.suites:
+        threshold = args.e2e_threshold if suite == 'e2e' else args.threshold
+        for name, func in SUITES[suite]():
+            if args.filter not in name:
+                continue
+            try:
+                seconds = results[name] = measure(func, args.repeat)
+            except CommandFailed as e:
+                print(f'{name:<40} FAILED\n{e}', flush=True)
+                failures.append(name)
+                continue
+            if name in baseline:
+                # A slowdown only counts if it shows up again when measured
+                # anew, since a busy moment on the machine can slow every run
+                # of a single measurement
+                for _ in range(args.confirm):
+                    if seconds / baseline[name] - 1 <= threshold:
+                        break
+                    seconds = results[name] = min(seconds, measure(func, args.repeat))
+            line = f'{name:<40} {seconds * 1000:10.2f} ms'
+            if name in baseline:
+                change = seconds / baseline[name] - 1
+                line += f' {change:+8.1%}'
+                if change > threshold:
+                    line += ' REGRESSION'
+                    regressions.append(name)
+            print(line, flush=True)
+
+    if failures:
+        print(f'{len(failures)} benchmark(s) failed')
+        sys.exit(1)
+    if args.save:
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps({'machine': MACHINE, 'results': baseline}, indent=2, sort_keys=True) + '\n')
+        print(f"Baseline written to '{BASELINE_PATH}'")
+    elif regressions:
+        print(f'{len(regressions)} benchmark(s) slower than the baseline by more than the allowed threshold')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
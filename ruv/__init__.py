@@ -1,26 +1,61 @@
 import argparse
+import io
+import os
 import subprocess
 import re
 import sys
-from functools import partial
+import tempfile
+import threading
+from concurrent.futures import Future
+from functools import partial, lru_cache
 from datetime import timedelta, date
 from urllib.parse import urlsplit, parse_qs
 
-from requests.exceptions import HTTPError, ConnectionError
+from requests.exceptions import RequestException, HTTPError, ConnectionError, Timeout
 
-from .choose import choose
-from .conf import config_exists, copy_config, CONFIG_PATH, PLAYER, DEFAULT_TERMINAL_COLORS
+from .choose import choose, Session, Cancelled, ItemSource
+from .conf import (config_exists, copy_config, CONFIG_PATH, CATALOG_PATH, PLAYER, DEFAULT_TERMINAL_COLORS,
+        CATEGORY_REFRESH_INTERVAL, CATALOG_MAX_AGE)
 import ruv.api as api
 import ruv.__version__ as about
 from .geoapi import get_channel_stream
+from .epg import write_epg, WRITERS
+from .parallel import ordered_map
+from .categories import Categories
+from .snapshot import Snapshot, write as write_snapshot
+from .resilience import CircuitOpenError
+from .trace import tracer, span, profile
 
-eprint = partial(print, file=sys.stderr)
-choose = partial(choose, default_terminal_colors=DEFAULT_TERMINAL_COLORS)
+session = Session(DEFAULT_TERMINAL_COLORS)
+choose = partial(choose, session=session)
+
+
+def eprint(*args):
+    if session.active:
+        session.notify(' '.join(map(str, args)))
+    else:
+        print(*args, file=sys.stderr)
 
 RUV_URL = 'http://ruv.is/'
 CHANNEL_NAMES = ['ruv', 'ruv2']
 RADIO_NAMES = ['ras1', 'ras2', 'rondo']
 RADIO_ALIASES = {'rondo': 'ras3'}
+CATEGORY_TITLES = {
+    'born': 'Barnaefni',
+    'frettir': 'Fréttir',
+    'ithrottir': 'Íþróttir',
+    'heimildarmyndir': 'Heimildarmyndir',
+    'kvikmyndir': 'Kvikmyndir',
+    'leikid-efni': 'Leikið efni',
+    'menning': 'Menning',
+    'fraedsla': 'Fræðsla',
+    'afthreying': 'Afþreying',
+}
+
+
+@lru_cache(maxsize=None)
+def open_catalog():
+    return Snapshot.open(str(CATALOG_PATH), max_age=CATALOG_MAX_AGE)
 
 
 def graceful(func):
@@ -30,6 +65,10 @@ def graceful(func):
         except HTTPError as e:
             eprint(f'The RUV API responded with an error ({e.response.status_code})')
             eprint(f'URL: {e.request.url}')
+        except CircuitOpenError:
+            eprint('The RUV API appears to be down, try again later')
+        except Timeout:
+            eprint('The RUV API took too long to respond')
         except ConnectionError:
             eprint('Error connecting to the RUV API')
     return wrapper
@@ -37,7 +76,7 @@ def graceful(func):
 
 @graceful
 def play_stream(args, channel):
-    res = get_channel_stream(channel)
+    res = session.run(get_channel_stream, channel, message='Fetching stream')
     if res.get('geoblock'):
         eprint('You appeared to be geoblocked')
     url = res.get('url')
@@ -49,7 +88,8 @@ def play_stream(args, channel):
         player = [args.video_player]
     else:
         player = PLAYER
-    subprocess.call(player + [url])
+    with session.suspended(), span('player', command=player + [url]):
+        subprocess.call(player + [url])
 
 
 def live(args):
@@ -68,33 +108,56 @@ def radio(args):
     play_stream(args, RADIO_ALIASES.get(args.channel, args.channel))
 
 
-def menu(choices, title, on_chosen, display=lambda x: x.display()):
+def menu(choices, title, on_chosen, display=lambda x: x.display(), source=None, pending=None):
     choice = None
-    while True:
-        index = (choice and choice.index) or 0
-        choice = choose(
-                choices,
-                title=title,
-                display=display,
-                initial_index=index
-        )
-        if choice is None:
-            break
-        on_chosen(choice.item)
+    with session:
+        while True:
+            index = (choice and choice.index) or 0
+            choice = choose(
+                    choices,
+                    title=title,
+                    display=display,
+                    initial_index=index,
+                    source=source,
+                    pending=pending
+            )
+            if choice is None:
+                break
+            try:
+                on_chosen(choice.item)
+            except Cancelled:
+                pass
 
 
 def program_details_menu(args, program_id):
-    details = api.program_details(program_id)
-    menu(details.episodes, details.header, lambda ep: play_stream(args, ep.file))
+    # Episode lists change as new episodes air, so the catalog snapshot is
+    # only used when the API cannot be reached
+    details = api.program_details_stream(program_id)
+    source = ItemSource(details)
+    try:
+        try:
+            session.run(source.wait, message='Fetching episodes')
+        except RequestException:
+            catalog = open_catalog()
+            known = catalog and catalog.details(program_id)
+            if not (known and known.episodes):
+                raise
+            eprint('The RUV API could not be reached, showing episodes from the catalog')
+            menu(known.episodes, known.header, lambda ep: play_stream(args, ep.file))
+            return
+        header = details.partial(title=None, foreign_title=None, description=None).header
+        menu(source.items, header, lambda ep: play_stream(args, ep.file), source=source)
+    finally:
+        source.cancel()
 
 
-def choose_program_menu(args, programs, title):
+def choose_program_menu(args, programs, title, source=None):
     def when_chosen(prog):
         if not prog.multiple_episodes:
             play_stream(args, prog.episodes[0].file)
         else:
             program_details_menu(args, prog.id)
-    menu(programs, title, when_chosen)
+    menu(programs, title, when_chosen, source=source)
 
 
 @graceful
@@ -107,6 +170,12 @@ def play(args):
         print('Unplayable URL')
         return
     ep_id = (query['ep'] or '') and query['ep'][0]
+    catalog = open_catalog()
+    if catalog:
+        program_id, episode = catalog.episode(ep_id)
+        if episode and program_id == prog_id:
+            play_stream(args, episode.file)
+            return
     details = api.program_details(prog_id)
     eps = [ep for ep in details.episodes if ep.id == ep_id]
     if not eps:
@@ -118,34 +187,177 @@ def play(args):
 
 @graceful
 def search(args):
-    results = api.search(args.query)
+    if args.batch:
+        search_batch(args)
+        return
+    if args.query is None:
+        eprint('A query or --batch is required')
+        return
+    try:
+        results = api.search(args.query)
+    except RequestException:
+        # The latest episode may be missing from the catalog snapshot, so it
+        # is only used when the API cannot be reached
+        catalog = open_catalog()
+        known = args.play and catalog and catalog.search(args.query, limit=1)
+        if not known:
+            raise
+        eprint('The RUV API could not be reached, playing from the catalog')
+        play_program(args, known[0], complete=True)
+        return
     if results.empty():
         print('No shows matched query')
         return
     if args.play:
-        program = results.programs[0]
-        print('Chosen show is: %s' % program.title)
-        episodes = program.episodes
-        if episodes:
-            if args.offset:
-                details = api.program_details_menu(program.id)
-                episodes = details.episodes
-            if args.offset >= len(episodes):
-                print('Offset out of range, playing oldest')
-                args.offset = -1
-            episode = episodes[args.offset]
-            print("Playing:")
-            if program.multiple_episodes:
-                print(episode.display())
-            else:
-                print(program.display())
-            play_stream(args, episode.file)
-        else:
-            print('No episodes available')
+        play_program(args, results.programs[0])
     else:
         choose_program_menu(args, results.programs, results.title)
 
 
+def play_program(args, program, complete=False):
+    print('Chosen show is: %s' % program.title)
+    episodes = program.episodes
+    if episodes:
+        if args.offset and not complete:
+            details = api.program_details(program.id)
+            episodes = details.episodes
+        if args.offset >= len(episodes):
+            print('Offset out of range, playing oldest')
+            args.offset = -1
+        episode = episodes[args.offset]
+        print("Playing:")
+        if program.multiple_episodes:
+            print(episode.display())
+        else:
+            print(program.display())
+        play_stream(args, episode.file)
+    else:
+        print('No episodes available')
+
+
+@graceful
+def categories(args):
+    names = args.category or list(CATEGORY_TITLES)
+    cats = Categories(names)
+    if CATEGORY_REFRESH_INTERVAL:
+        cats.refresh_periodically(CATEGORY_REFRESH_INTERVAL)
+
+    def display(name):
+        title = CATEGORY_TITLES.get(name, name)
+        if cats.failed(name):
+            return f'{title} (unavailable)'
+        if not cats.loaded(name):
+            return f'{title} (loading)'
+        return f'{title} ({len(cats.get(name).programs or [])} programs)'
+
+    @graceful
+    def when_chosen(name):
+        listing = cats.listing(name)
+        session.run(listing.wait, message='Fetching category')
+        if not listing.items:
+            eprint('No programs in category')
+            return
+        choose_program_menu(args, listing.items, CATEGORY_TITLES.get(name, name), source=listing)
+
+    menu(names, 'Categories', when_chosen, display=display, pending=cats.pending)
+
+
+@graceful
+def catalog(args):
+    cats = Categories(args.category or list(CATEGORY_TITLES))
+    programs = {}
+    try:
+        for panel in api.featured().panels or []:
+            for program in panel.programs or []:
+                programs.setdefault(program.id, program)
+    except RequestException as e:
+        eprint(f'Skipping featured programs ({e})')
+    for name in cats.names:
+        try:
+            results = cats.get(name)
+        except (RequestException, ValueError) as e:
+            eprint(f"Skipping category '{name}' ({e})")
+            continue
+        for program in results.programs or []:
+            programs.setdefault(program.id, program)
+
+    def with_episodes(program):
+        if program.multiple_episodes:
+            try:
+                details = api.program_details(program.id)
+            except RequestException as e:
+                eprint(f"Episodes of '{program.title}' not included ({e})")
+                return program
+            program.episodes = details.episodes
+            program.description = details.description
+        return program
+
+    complete = list(ordered_map(with_episodes, programs.values(), args.jobs))
+    write_snapshot(str(CATALOG_PATH), complete)
+    print(f"Catalog of {len(complete)} programs written to '{CATALOG_PATH}'")
+
+
+def read_queries(lines):
+    for line in lines:
+        query = line.strip()
+        if query:
+            yield query
+
+
+def search_batch(args):
+    try:
+        f = sys.stdin if args.batch == '-' else open(args.batch)
+    except OSError as e:
+        eprint(f"Could not read queries from '{args.batch}' ({e.strerror})")
+        return
+    programs = {}
+    # Episode lists by program id, fetched once however many queries and
+    # threads ask for them
+    details = {}
+    details_lock = threading.Lock()
+
+    def all_episodes(program):
+        with details_lock:
+            episodes = details.get(program.id)
+            fetch = episodes is None
+            if fetch:
+                episodes = details[program.id] = Future()
+        if fetch:
+            try:
+                episodes.set_result(api.program_details(program.id).episodes)
+            except BaseException as e:
+                episodes.set_exception(e)
+        return episodes.result()
+
+    def resolve(query):
+        try:
+            results = api.search(query)
+            # Programs appearing in several result sets are shared by id
+            found = [programs.setdefault(p.id, p) for p in results.programs or []]
+            if not found:
+                return [query]
+            program = found[0]
+            episodes = program.episodes
+            if episodes and args.offset:
+                episodes = all_episodes(program)
+            if not episodes:
+                return [query, program.id, program.title]
+            episode = episodes[args.offset] if args.offset < len(episodes) else episodes[-1]
+            return [query, program.id, program.title, episode.id, episode.file]
+        except RequestException as e:
+            eprint(f"Search for '{query}' failed: {e}")
+            return [query]
+
+    try:
+        for fields in ordered_map(resolve, read_queries(f), args.jobs):
+            fields += [''] * (5 - len(fields))
+            print('\t'.join(str(field) for field in fields), flush=True)
+    finally:
+        # stdin is left open for whoever reads it next
+        if f is not sys.stdin:
+            f.close()
+
+
 @graceful
 def featured(args):
     feat = api.featured()
@@ -166,6 +378,57 @@ def schedule(args):
     menu(schedule.events, schedule.long_title, when_selected)
 
 
+def _file_mode(path):
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@graceful
+def epg(args):
+    # Schedules are still amended shortly after airing, so only days before
+    # yesterday are cached on disk
+    settled = date.today() - timedelta(days=1)
+
+    def fetch(job):
+        channel, day = job
+        try:
+            return api.schedule(channel, day, persist=day < settled)
+        except RequestException as e:
+            eprint(f'No schedule for {channel} on {day} ({e})')
+
+    channels = [RADIO_ALIASES.get(c, c) for c in args.channel or CHANNEL_NAMES + RADIO_NAMES]
+    days = [date.today() + timedelta(days=args.start + i) for i in range(args.days)]
+    schedules = ordered_map(fetch, [(c, d) for c in channels for d in days], args.jobs)
+    listings = ((channel, [next(schedules) for _ in days]) for channel in channels)
+    if args.output == '-':
+        # The documents are UTF-8 whatever the locale, and iCal needs its CRLFs kept
+        sys.stdout.flush()
+        out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='')
+        try:
+            write_epg(out, args.format, channels, listings)
+        finally:
+            out.detach()
+    else:
+        # Written next to the output and moved in place once complete, so a
+        # failed export leaves the previous document intact
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(args.output)))
+        try:
+            # mkstemp creates the file readable by its owner only, so it gets
+            # the mode of the file it replaces, or that of a new file
+            os.fchmod(fd, _file_mode(args.output))
+            with open(fd, 'w', encoding='utf-8', newline='') as out:
+                write_epg(out, args.format, channels, listings)
+            os.replace(temp, args.output)
+        except BaseException:
+            os.remove(temp)
+            raise
+    api.client.disk.prune()
+
+
 def config(args):
     if config_exists():
         inp = input('Config file already exists. Overwrite? [y/N] ')
@@ -181,10 +444,21 @@ def version():
     print(f'Written by {about.__author__} ({about.__author_email__})')
 
 
+def positive(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1, not {number}')
+    return number
+
+
 def main():
     parser = argparse.ArgumentParser(description='A command line interface for RUV', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-p', '--video-player', metavar='PLAYER', help='The video player used to play the stream', default=None)
     parser.add_argument('--version', help='Print the version information and exit', action='store_true')
+    parser.add_argument('--trace', help='Record timings of each phase of the command and print a summary', action='store_true')
+    parser.add_argument('--trace-output', metavar='FILE', default='-',
+            help='File the trace summary is written to, - for stderr. Files ending in .json get a Chrome trace')
+    parser.add_argument('--profile', help='Profile the command and print the functions where most time was spent', action='store_true')
 
     subparsers = parser.add_subparsers()
 
@@ -202,15 +476,36 @@ def main():
     schedule_parser.set_defaults(func=schedule)
 
     show_parser = subparsers.add_parser('search', help='Search for programs')
-    show_parser.add_argument('query', metavar='QUERY', help='Search shows matching this query')
+    show_parser.add_argument('query', metavar='QUERY', nargs='?', help='Search shows matching this query')
+    show_parser.add_argument('-b', '--batch', metavar='FILE', help='Search for each line of FILE, - for stdin. For every query a tab separated line with the program id, title, episode id and episode file is printed, in input order')
+    show_parser.add_argument('-j', '--jobs', type=positive, default=8, help='Number of searches run concurrently in batch mode')
     show_parser.add_argument('-p', '--play', help='If query matches any program, the latest episode of the first program will be played.', action='store_true')
     show_parser.add_argument('-o', '--offset', help='Offset when playing an episode. An offset of 1 means the second latest episode will be played, 2 the third latest, etc.',
             default=0, type=int, metavar='OFFSET')
     show_parser.set_defaults(func=search)
 
+    epg_parser = subparsers.add_parser('epg', help='Export channel schedules as an XMLTV or iCal document')
+    epg_parser.add_argument('-c', '--channel', metavar='CHANNEL', action='append', choices=CHANNEL_NAMES + RADIO_NAMES,
+            help=f'Channel to include, may be repeated. Choose from: {", ".join(CHANNEL_NAMES + RADIO_NAMES)}. Default: all channels')
+    epg_parser.add_argument('-s', '--start', metavar='DAY', type=int, default=0, help='Day offset of the first day. 0 is today, -n is n days in the past and n is n days in the future.')
+    epg_parser.add_argument('-d', '--days', type=int, default=7, help='Number of days to export')
+    epg_parser.add_argument('-f', '--format', choices=list(WRITERS), default='xmltv', help='Format of the document')
+    epg_parser.add_argument('-o', '--output', metavar='FILE', default='-', help='File to write the document to, - for stdout')
+    epg_parser.add_argument('-j', '--jobs', type=positive, default=8, help='Number of schedules fetched concurrently')
+    epg_parser.set_defaults(func=epg)
+
     featured_parser = subparsers.add_parser('featured', help='List features programs')
     featured_parser.set_defaults(func=featured)
 
+    categories_parser = subparsers.add_parser('categories', help='Browse programs by category')
+    categories_parser.add_argument('category', metavar='CATEGORY', nargs='*', help=f'Categories to browse. Default: {", ".join(CATEGORY_TITLES)}')
+    categories_parser.set_defaults(func=categories)
+
+    catalog_parser = subparsers.add_parser('catalog', help='Save a snapshot of all programs and episodes, used for instant lookups')
+    catalog_parser.add_argument('category', metavar='CATEGORY', nargs='*', help=f'Categories to include. Default: {", ".join(CATEGORY_TITLES)}')
+    catalog_parser.add_argument('-j', '--jobs', type=positive, default=8, help='Number of programs fetched concurrently')
+    catalog_parser.set_defaults(func=catalog)
+
     play_parser = subparsers.add_parser('play', help='Play a program from a URL')
     play_parser.add_argument('url', metavar='URL', help='URL of the page containing the stream')
     play_parser.set_defaults(func=play)
@@ -224,8 +519,17 @@ def main():
         return
     if not hasattr(args, 'func'):
         parser.print_help()
-    else:
-        args.func(args)
+        return
+    tracer.enabled = args.trace
+    try:
+        with span('command', argv=sys.argv[1:]):
+            if args.profile:
+                profile(args.func, args)
+            else:
+                args.func(args)
+    finally:
+        if args.trace:
+            tracer.write(args.trace_output)
 
 if __name__ == '__main__':
     main()
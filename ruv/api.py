@@ -1,18 +1,118 @@
-import requests
+import os
+import threading
 from functools import wraps
-from urllib.parse import urljoin
+from urllib.parse import urljoin, quote
 from datetime import date
-from .models import Overview, SearchResults, ProgramDetails, Schedule
+from .models import Overview, SearchResults, ProgramDetails, Schedule, Episode, Program
+from .cache import DiskCache
+from .parallel import background
+from .resilience import Client, SingleFlight
+from .stream import StreamParser
+from .trace import span
+from .conf import CACHE_DIR, SCHEDULE_CACHE_MAX_AGE, API_TIMEOUT, API_TIMEOUTS, API_RETRIES, API_HEDGE_REQUESTS, API_RATE_LIMIT, API_BURST
 
-API_URL = 'https://api.ruv.is/api/'
+API_URL = os.environ.get('RUV_API_URL', 'https://api.ruv.is/api/')
+
+client = Client(timeout=API_TIMEOUT, timeouts=API_TIMEOUTS, retries=API_RETRIES, hedge=API_HEDGE_REQUESTS,
+        rate=API_RATE_LIMIT, burst=API_BURST)
+client.disk = DiskCache(str(CACHE_DIR / 'responses'), max_age=SCHEDULE_CACHE_MAX_AGE)
+flights = SingleFlight()
+# Streamed requests in progress, by URL
+streams = {}
+streams_lock = threading.Lock()
+
+if 'RUV_RECORD' in os.environ:
+    from .mockapi import Recorder
+    client.recorder = Recorder(os.environ['RUV_RECORD'])
 
 def json(model):
+    # Callers pass persist=True for responses that are not expected to change,
+    # which are then kept in the disk cache
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, persist=False, **kwargs):
+            url = func(*args, **kwargs)
+            def fetch():
+                payload = client.get_json(url, endpoint=func.__name__, persist=persist)
+                with span('model.build', model=model.__name__):
+                    return model(payload)
+            # Concurrent callers of the same URL share a single request and model
+            return flights.do(url, fetch)
+        return wrapper
+    return decorator
+
+class Progressive:
+    # Iterating yields the items of a response as they arrive. The response is
+    # read once, in the background, and any number of iterations follow it from
+    # its first item. Afterwards the complete model is available as `result`.
+    def __init__(self, url, endpoint, model, key, item_model):
+        self.url = url
+        self.endpoint = endpoint
+        self.model = model
+        self.key = key
+        self.item_model = item_model
+        self.parser = StreamParser(key)
+        self.result = None
+        self.items = []
+        self.done = False
+        self.error = None
+        self._changed = threading.Condition()
+        background(self._read)
+
+    @property
+    def fields(self):
+        return self.parser.fields
+
+    def partial(self, **defaults):
+        # The model as far as it has been received, without the streamed items
+        return self.model(dict(defaults, **self.fields))
+
+    def _read(self):
+        try:
+            for raw in client.iter_json(self.url, self.parser, endpoint=self.endpoint):
+                item = self.item_model(raw)
+                with self._changed:
+                    self.items.append(item)
+                    self._changed.notify_all()
+            self.result = self.model(self.parser.fields)
+            setattr(self.result, self.key, list(self.items))
+        except Exception as e:
+            self.error = e
+        finally:
+            with streams_lock:
+                if streams.get(self.url) is self:
+                    del streams[self.url]
+            with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    def __iter__(self):
+        position = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: position < len(self.items) or self.done)
+                if position == len(self.items):
+                    if self.error is not None:
+                        raise self.error
+                    return
+                item = self.items[position]
+            position += 1
+            yield item
+
+def streamed(model, key, item_model, endpoint):
+    # endpoint names the JSON endpoint returning the same document, whose
+    # timeout and latency samples the stream shares
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            resp = func(*args, **kwargs)
-            resp.raise_for_status()
-            return model(resp.json())
+            url = func(*args, **kwargs)
+            # Concurrent callers of the same URL follow a single streamed
+            # request, as the JSON endpoints do through flights
+            with streams_lock:
+                stream = streams.get(url)
+                if stream is None:
+                    stream = streams[url] = Progressive(url, endpoint, model, key, item_model)
+            return stream
         return wrapper
     return decorator
 
@@ -27,29 +127,36 @@ def api_path(path):
 @json(SearchResults)
 @api_path('programs/search/tv/')
 def search(path, search_str):
-    search_path = path + search_str
-    return requests.get(search_path)
+    return path + quote(search_str, safe='')
 
 @json(Overview)
 @api_path('programs/featured/tv/')
 def featured(path):
-    return requests.get(path)
+    return path
 
 @json(ProgramDetails)
 @api_path('programs/program/%s/all/')
 def program_details(path, program_id):
-    path = path % program_id
-    return requests.get(path)
+    return path % program_id
 
 @json(Schedule)
 @api_path('schedule/%s/%s/')
 def schedule(path, channel='ruv', day=None):
     if day is None:
         day = date.today()
-    return requests.get(path % (channel, date.strftime(day, '%Y-%m-%d')))
+    return path % (channel, date.strftime(day, '%Y-%m-%d'))
 
 @json(SearchResults)
 @api_path('programs/category/tv/')
 def category(path, category):
-    path = path + category
-    return requests.get(path)
+    return path + quote(category, safe='')
+
+@streamed(ProgramDetails, 'episodes', Episode, endpoint='program_details')
+@api_path('programs/program/%s/all/')
+def program_details_stream(path, program_id):
+    return path % program_id
+
+@streamed(SearchResults, 'programs', Program, endpoint='category')
+@api_path('programs/category/tv/')
+def category_stream(path, category):
+    return path + quote(category, safe='')
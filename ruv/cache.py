@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class DiskCache:
+    def __init__(self, directory, max_age=None):
+        self.directory = directory
+        self.max_age = max_age
+
+    def _expired(self, path):
+        return self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key, stale=False):
+        # stale also returns entries that have expired but not been pruned yet
+        path = self._path(key)
+        try:
+            if not stale and self._expired(path):
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, payload):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.directory, delete=False) as f:
+                json.dump(payload, f)
+            os.replace(f.name, self._path(key))
+        except OSError:
+            pass
+
+    def prune(self):
+        # Removes expired entries
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if self._expired(path):
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,65 @@
+import time
+
+from . import api
+from .choose import ItemSource
+from .parallel import background
+
+
+class Listing(ItemSource):
+    # A category listing, streamed so that its programs can be shown as they arrive
+    def __init__(self, name):
+        self.stream = api.category_stream(name)
+        super().__init__(self.stream)
+
+    @property
+    def results(self):
+        self.join()
+        return self.stream.result
+
+
+class Categories:
+    # Category listings, all fetched concurrently up front and kept in memory.
+    # A refresh replaces a listing only once the new one has arrived.
+    def __init__(self, names):
+        self.names = names
+        self.listings = {name: Listing(name) for name in names}
+
+    def loaded(self, name):
+        listing = self.listings[name]
+        return listing.done and listing.error is None
+
+    def failed(self, name):
+        listing = self.listings[name]
+        return listing.done and listing.error is not None
+
+    def pending(self):
+        return any(not listing.done for listing in self.listings.values())
+
+    def listing(self, name):
+        # A failed listing is fetched again when asked for
+        if self.failed(name):
+            self.listings[name] = Listing(name)
+        return self.listings[name]
+
+    def get(self, name):
+        return self.listing(name).results
+
+    def _refresh_one(self, name):
+        listing = Listing(name)
+        try:
+            listing.join()
+        except Exception:
+            return
+        self.listings[name] = listing
+
+    def refresh(self):
+        for name in self.names:
+            background(self._refresh_one, name)
+
+    def _refresh_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+    def refresh_periodically(self, interval):
+        background(self._refresh_forever, interval)
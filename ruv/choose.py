@@ -1,11 +1,17 @@
 import curses
 
 import textwrap
+import threading
+import itertools
 import logging
 import re
 import os
 
 from collections import namedtuple
+from contextlib import contextmanager
+
+from .parallel import background
+from .trace import span
 
 BULLET = '•'
 
@@ -18,8 +24,11 @@ START_KEYS = (curses.KEY_HOME, ord('g'))
 PAGE_UP_KEYS = (curses.KEY_PPAGE, CTRL ^ ord('u'))
 PAGE_DOWN_KEYS = (curses.KEY_NPAGE, CTRL ^ ord('d'))
 END_KEYS = (curses.KEY_END, ord('G'))
-QUIT_KEYS = (27, ord('q'))
+ESC = 27
+QUIT_KEYS = (ESC, ord('q'))
 PAGE_STEP = 15
+SPINNER = '|/-\\'
+POLL_INTERVAL = 100
 
 starting_space = re.compile(r'^ +')
 
@@ -31,6 +40,154 @@ class Colors:
 
 COLORS = Colors()
 
+
+class Cancelled(Exception):
+    pass
+
+
+class ItemSource:
+    # A list filled from an iterable in a background thread
+    def __init__(self, iterable):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self._started = threading.Event()
+        self._finished = threading.Event()
+        background(self._fill, iterable)
+
+    def _fill(self, iterable):
+        try:
+            for item in iterable:
+                if self.cancelled:
+                    break
+                self.items.append(item)
+                self._started.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._started.set()
+            self._finished.set()
+
+    def wait(self):
+        # Block until the first item arrives or the iterable is exhausted
+        self._started.wait()
+        if self.error is not None and not self.items:
+            raise self.error
+
+    def join(self):
+        # Block until the iterable is exhausted
+        self._finished.wait()
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Session:
+    def __init__(self, default_terminal_colors=False):
+        self.default_colors = default_terminal_colors
+        self.screen = None
+        self.depth = 0
+        self.messages = []
+
+    @property
+    def active(self):
+        return self.screen is not None
+
+    def __enter__(self):
+        if self.depth == 0:
+            self._start()
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            self._stop()
+
+    def _start(self):
+        self.screen = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        curses.start_color()
+
+        if self.default_colors:
+            curses.use_default_colors()
+            COLORS.normal = curses.A_NORMAL
+            COLORS.highlight = curses.A_STANDOUT
+            COLORS.title = curses.A_BOLD
+        else:
+            curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
+            curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_WHITE)
+            curses.init_pair(3, curses.COLOR_YELLOW, curses.COLOR_BLACK)
+            COLORS.normal = curses.color_pair(1)
+            COLORS.highlight = curses.color_pair(2)
+            COLORS.title = curses.color_pair(3) | curses.A_BOLD
+
+        self.screen.keypad(1)
+        curses.curs_set(0)
+
+    def _stop(self):
+        self.screen.keypad(0)
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
+        self.screen = None
+
+    @contextmanager
+    def suspended(self):
+        if not self.active:
+            yield
+            return
+        curses.endwin()
+        try:
+            yield
+        finally:
+            self.screen.refresh()
+
+    def status(self, text):
+        y, x = self.screen.getmaxyx()
+        self.screen.move(y - 1, 0)
+        self.screen.clrtoeol()
+        if text:
+            self.screen.addstr(y - 1, 2, text[:max(x - 4, 0)], COLORS.title)
+        self.screen.refresh()
+
+    def show_messages(self):
+        if self.messages:
+            self.status(' '.join(self.messages))
+
+    def clear_messages(self):
+        if self.messages:
+            self.messages = []
+            self.status(None)
+
+    def notify(self, text):
+        self.messages.append(text)
+        self.show_messages()
+
+    def run(self, func, *args, message='Loading', **kwargs):
+        # Esc abandons the call rather than stopping it: it finishes in its
+        # background thread, where other callers may share its result, and
+        # whatever it fetched still ends up in the cache
+        if not self.active:
+            return func(*args, **kwargs)
+        future = background(func, *args, **kwargs)
+        frames = itertools.cycle(SPINNER)
+        self.screen.timeout(POLL_INTERVAL)
+        try:
+            while not future.done():
+                self.status(f'{next(frames)} {message}... (Esc to cancel)')
+                if self.screen.getch() == ESC:
+                    raise Cancelled()
+        finally:
+            self.screen.timeout(-1)
+            self.status(None)
+        return future.result()
+
 def wrap(text, width, indent=0, **kwargs):
     try:
         ind = ' ' * indent
@@ -101,23 +258,33 @@ class Page:
 Choice = namedtuple('Choice', ['index', 'item'])
 
 class ListDisplay:
-    def __init__(self, items, title=None, display=str, itemize=None, initial_index=0, allow_exit=True, default_terminal_colors=False):
-        if not items:
+    def __init__(self, items, session, title=None, display=str, itemize=None, initial_index=0, allow_exit=True, source=None, pending=None):
+        if source is not None:
+            items = source.items
+        elif not items:
             raise ValueError('List cannot be empty')
-        if initial_index >= len(items):
+        if initial_index >= max(len(items), 1):
             raise ValueError('Initial index too large')
 
         self.index = initial_index
         self.page = 0
         self.title = title
-        self._setup(default_terminal_colors)
+        self.session = session
+        self.source = source
+        # pending, if given, tells whether the text of items may still change
+        self.pending = pending
+        self.was_pending = pending is not None
+        self.error_shown = False
+        self.frames = itertools.cycle(SPINNER)
+        self._setup()
         self.items = items
         self.display = display
         self.itemize = itemize
         self.allow_exit = allow_exit
 
-        self._update_lines()
-        self._paginate()
+        with span('choose.layout', items=len(items), width=self.cols):
+            self._update_lines()
+            self._paginate()
         self._find_current_page()
 
     @property
@@ -130,46 +297,55 @@ class ListDisplay:
             return 0
         return len(self.title_lines)
 
+    @property
+    def loading(self):
+        return self.source is not None and not (self.source.done and len(self.lines) == len(self.items))
+
     def _paginate(self):
-        self.pages = []
-        page_lines = []
-        page_height = 0
-        for index, line in enumerate(self.lines):
+        self.pages = [Page([])]
+        self.page_height = 0
+        self._extend_pages(self.lines)
+
+    def _extend_pages(self, lines):
+        page_lines = self.pages[-1].lines
+        page_height = self.page_height
+        for line in lines:
             if page_height + line.size >= self.rows - 1:
-                self.pages.append(Page(page_lines))
                 page_lines = []
+                self.pages.append(Page(page_lines))
                 page_height = 0
             page_lines.append(line)
             page_height += line.size
-        self.pages.append(Page(page_lines))
+        self.page_height = page_height
+
+    def _extend(self):
+        new_items = self.items[len(self.lines):]
+        if not new_items:
+            return False
+        lines = [Line(self.box, self.display(it), self.cols, self.itemize) for it in new_items]
+        self.lines.extend(lines)
+        self._extend_pages(lines)
+        return True
+
+    def _relabel(self):
+        if self.pending is None:
+            return False
+        texts = [self.display(it) for it in self.items[:len(self.lines)]]
+        if texts == [line.text for line in self.lines]:
+            return False
+        self._update_lines()
+        self._paginate()
+        self._find_current_page()
+        return True
 
     def _update_size(self):
         y, x = self.screen.getmaxyx()
         self.rows = y - 2
         self.cols = x - 2
 
-    def _setup(self, default_colors):
-        self.screen = curses.initscr()
+    def _setup(self):
+        self.screen = self.session.screen
         self.screen.erase()
-        curses.noecho()
-        curses.cbreak()
-        curses.start_color()
-
-        if default_colors:
-            curses.use_default_colors()
-            COLORS.normal = curses.A_NORMAL
-            COLORS.highlight = curses.A_STANDOUT
-            COLORS.title = curses.A_BOLD
-        else:
-            curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
-            curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_WHITE)
-            curses.init_pair(3, curses.COLOR_YELLOW, curses.COLOR_BLACK)
-            COLORS.normal = curses.color_pair(1)
-            COLORS.highlight = curses.color_pair(2)
-            COLORS.title = curses.color_pair(3) | curses.A_BOLD
-
-        self.screen.keypad(1)
-        curses.curs_set(0)
         self._update_size()
 
         self._setup_title()
@@ -209,15 +385,17 @@ class ListDisplay:
             return
         self._setup_title()
         self.box = curses.newwin(self.rows, self.cols, self.title_height + 1, 1)
-        self._update_lines()
+        with span('choose.layout', items=len(self.items), width=self.cols):
+            self._update_lines()
+            self._paginate()
         self.screen.erase()
         self.box.erase()
-        self._paginate()
         self._find_current_page()
 
     def _display_page_number(self):
         index = self.rows - 1
-        page_text = f' Page {self.page + 1} / {len(self.pages)} '[:self.cols-2]
+        more = '+' if self.loading else ''
+        page_text = f' Page {self.page + 1} / {len(self.pages)}{more} '[:self.cols-2]
         position = max(self.cols - len(page_text) - 2, 1)
         self.box.addstr(index, position, page_text, COLORS.normal)
 
@@ -230,6 +408,23 @@ class ListDisplay:
 
         self.screen.refresh()
         self.box.refresh()
+        self.session.show_messages()
+        self._display_loading()
+
+    def _display_loading(self):
+        if self.source is None:
+            return
+        if not self.loading and self.source.error is not None and not self.error_shown:
+            # The list is shown as far as it arrived, but must not pass for complete
+            self.error_shown = True
+            self.session.notify(f'Loading stopped after {len(self.items)} items: {self.source.error}')
+            return
+        if self.session.messages:
+            return
+        if self.loading:
+            self.session.status(f'{next(self.frames)} Loading... ({len(self.items)} so far)')
+        else:
+            self.session.status(None)
 
     def page_up(self):
         if self.index < PAGE_STEP:
@@ -279,6 +474,10 @@ class ListDisplay:
             (START_KEYS, self.first),
             (END_KEYS, self.last),
         ]
+        if not self.lines:
+            if x == curses.KEY_RESIZE:
+                self._resize()
+            return True
         if x == ord('\n'):
             return False
         for keys, action in actions:
@@ -286,27 +485,42 @@ class ListDisplay:
                 action()
         return True
 
+    def _getch(self):
+        # Poll while items are still arriving or changing, so they can be shown
+        # as they come. One more poll after pending turns false shows the last change.
+        pending = self.pending is not None and self.pending()
+        polling = self.loading or pending or self.was_pending
+        self.was_pending = pending
+        self.screen.timeout(POLL_INTERVAL if polling else -1)
+        return self.screen.getch()
+
     def choose(self):
         try:
             self._display_page()
 
-            x = self.screen.getch()
+            x = self._getch()
             while x not in QUIT_KEYS or not self.allow_exit:
-                if not self.handle_keypress(x):
-                    break
-
-                self.box.erase()
-                self.box.attron(COLORS.normal)
-                self.box.border(0)
-                self.box.attroff(COLORS.normal)
-
-                self._display_page()
-
-                x = self.screen.getch()
+                if x != -1:
+                    self.session.clear_messages()
+                    if not self.handle_keypress(x):
+                        break
+
+                if self._extend() or self._relabel() or x != -1:
+                    self.box.erase()
+                    self.box.attron(COLORS.normal)
+                    self.box.border(0)
+                    self.box.attroff(COLORS.normal)
+
+                    self._display_page()
+                else:
+                    self._display_loading()
+
+                x = self._getch()
             else:
                 self.index = None
 
-            curses.endwin()
+            self.screen.timeout(-1)
+            self.session.clear_messages()
 
             if self.index is None:
                 return None
@@ -315,14 +529,16 @@ class ListDisplay:
             logging.exception('Something bad happened')
 
 
-def choose(choices, title=None, display=None, index=True, **args):
+def choose(choices, title=None, display=None, index=True, session=None, default_terminal_colors=False, **args):
     if 'bullet' in args:
         args['itemize'] = BULLET
         del args['bullet']
-    list_display = ListDisplay(
-            choices,
-            title,
-            display=display,
-            **args
-    )
-    return list_display.choose()
+    with session or Session(default_terminal_colors) as session:
+        list_display = ListDisplay(
+                choices,
+                session,
+                title,
+                display=display,
+                **args
+        )
+        return list_display.choose()
@@ -1,8 +1,11 @@
+import os
 import sys
 from pathlib import Path
 
 CONFIG_DIR = Path.home() / '.config' / 'ruvcli'
 CONFIG_PATH = CONFIG_DIR / 'config.py'
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'ruvcli'
+CATALOG_PATH = CACHE_DIR / 'catalog.snap'
 
 sys.path.append(str(CONFIG_DIR))
 
@@ -4,3 +4,38 @@ PLAYER = ['/usr/bin/mpv']
 
 # Respect default terminal colors in curses interface.
 DEFAULT_TERMINAL_COLORS = False
+
+# Timeout, in seconds, for requests to the RUV API
+API_TIMEOUT = 10
+
+# Per endpoint timeouts, overriding API_TIMEOUT
+API_TIMEOUTS = {
+    'search': 5,
+    'featured': 5,
+    'schedule': 5,
+    'channel': 5,
+    'program_details': 15,
+}
+
+# How many times failed requests to the RUV API are retried
+API_RETRIES = 3
+
+# Send a second request when the first one is slower than usual
+API_HEDGE_REQUESTS = True
+
+# Maximum number of requests per second sent to the RUV API, and how many
+# requests may be sent in a burst. Set API_RATE_LIMIT to None to disable.
+API_RATE_LIMIT = 10
+API_BURST = 20
+
+# How often, in seconds, category listings are refreshed while browsing
+# categories. Set to None to disable.
+CATEGORY_REFRESH_INTERVAL = 600
+
+# Schedules of past days fetched by `ruv epg` are cached on disk. Cached days
+# older than this many seconds are fetched again.
+SCHEDULE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Catalog snapshots written by `ruv catalog` older than this many seconds are
+# ignored. Set to None to always use the snapshot.
+CATALOG_MAX_AGE = 24 * 60 * 60
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import XMLGenerator
+
+from .models import parse_date
+
+GENERATOR = 'ruv'
+CHANNEL_DOMAIN = 'ruv.is'
+DISPLAY_NAMES = {
+    'ruv': 'RÚV',
+    'ruv2': 'RÚV 2',
+    'ras1': 'Rás 1',
+    'ras2': 'Rás 2',
+    'ras3': 'Rondó',
+}
+XMLTV_TIME = '%Y%m%d%H%M%S +0000'
+ICAL_TIME = '%Y%m%dT%H%M%SZ'
+ICAL_LINE_LENGTH = 75
+
+
+def channel_id(channel):
+    return f'{channel}.{CHANNEL_DOMAIN}'
+
+
+def _last(channel, event, start):
+    end_time = getattr(event, 'end_time', None)
+    return channel, event, start, end_time and parse_date(end_time)
+
+
+def programmes(channel, schedules):
+    # Events only carry their start time, so each one ends when the next one
+    # starts. The last event before a missing day, or of the range, ends at
+    # its end time, if known.
+    previous = None
+    for schedule in schedules:
+        if schedule is None:
+            if previous is not None:
+                yield _last(channel, *previous)
+            previous = None
+            continue
+        for event in getattr(schedule, 'events', None) or []:
+            start = parse_date(event.start_time)
+            if previous is not None:
+                yield channel, previous[0], previous[1], start
+            previous = (event, start)
+    if previous is not None:
+        yield _last(channel, *previous)
+
+
+def _episode_num(event):
+    number = getattr(event, 'episode_number', None)
+    if not number:
+        return None
+    total = getattr(event, 'number_of_episodes', None)
+    return f'.{int(number) - 1}{f"/{total}" if total else ""}.'
+
+
+class XMLTVWriter:
+    def __init__(self, out):
+        self.xml = XMLGenerator(out, encoding='utf-8', short_empty_elements=True)
+
+    def _element(self, name, text, **attrs):
+        self.xml.ignorableWhitespace('\n    ')
+        self.xml.startElement(name, attrs)
+        self.xml.characters(text)
+        self.xml.endElement(name)
+
+    def start(self):
+        self.xml.startDocument()
+        self.xml.startElement('tv', {'generator-info-name': GENERATOR})
+
+    def channel(self, channel):
+        self.xml.ignorableWhitespace('\n  ')
+        self.xml.startElement('channel', {'id': channel_id(channel)})
+        self._element('display-name', DISPLAY_NAMES.get(channel, channel), lang='is')
+        self.xml.ignorableWhitespace('\n  ')
+        self.xml.endElement('channel')
+
+    def programme(self, channel, event, start, stop):
+        attrs = {'start': start.strftime(XMLTV_TIME), 'channel': channel_id(channel)}
+        if stop is not None:
+            attrs['stop'] = stop.strftime(XMLTV_TIME)
+        self.xml.ignorableWhitespace('\n  ')
+        self.xml.startElement('programme', attrs)
+        self._element('title', event.title or '', lang='is')
+        if getattr(event, 'original_title', None):
+            self._element('title', event.original_title)
+        if event.description:
+            self._element('desc', '\n'.join(event.description), lang='is')
+        episode_num = _episode_num(event)
+        if episode_num:
+            self._element('episode-num', episode_num, system='xmltv_ns')
+        self.xml.ignorableWhitespace('\n  ')
+        self.xml.endElement('programme')
+
+    def end(self):
+        self.xml.ignorableWhitespace('\n')
+        self.xml.endElement('tv')
+        self.xml.ignorableWhitespace('\n')
+        self.xml.endDocument()
+
+
+def _ical_text(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _fold(line):
+    # Content lines are folded at 75 octets, without splitting characters
+    encoded = line.encode()
+    if len(encoded) <= ICAL_LINE_LENGTH:
+        return line
+    parts = []
+    limit = ICAL_LINE_LENGTH
+    while encoded:
+        cut = min(limit, len(encoded))
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode())
+        encoded = encoded[cut:]
+        limit = ICAL_LINE_LENGTH - 1
+    return '\r\n '.join(parts)
+
+
+class ICalWriter:
+    def __init__(self, out):
+        self.out = out
+        self.stamp = datetime.now(timezone.utc).strftime(ICAL_TIME)
+
+    def _line(self, name, value):
+        self.out.write(_fold(f'{name}:{value}') + '\r\n')
+
+    def start(self):
+        self._line('BEGIN', 'VCALENDAR')
+        self._line('VERSION', '2.0')
+        self._line('PRODID', f'-//{GENERATOR}//EPG//IS')
+
+    def channel(self, channel):
+        pass
+
+    def programme(self, channel, event, start, stop):
+        self._line('BEGIN', 'VEVENT')
+        self._line('UID', f'{channel}-{start.strftime(ICAL_TIME)}@{CHANNEL_DOMAIN}')
+        self._line('DTSTAMP', self.stamp)
+        self._line('DTSTART', start.strftime(ICAL_TIME))
+        self._line('DTEND', (stop or start + timedelta(minutes=30)).strftime(ICAL_TIME))
+        self._line('SUMMARY', _ical_text(event.title or ''))
+        if event.description:
+            self._line('DESCRIPTION', _ical_text('\n'.join(event.description)))
+        self._line('LOCATION', _ical_text(DISPLAY_NAMES.get(channel, channel)))
+        self._line('END', 'VEVENT')
+
+    def end(self):
+        self._line('END', 'VCALENDAR')
+
+
+WRITERS = {
+    'xmltv': XMLTVWriter,
+    'ical': ICalWriter,
+}
+
+
+def write_epg(out, fmt, channels, listings):
+    # listings yields (channel, schedules) in the order of channels
+    writer = WRITERS[fmt](out)
+    writer.start()
+    for channel in channels:
+        writer.channel(channel)
+    for channel, schedules in listings:
+        for programme in programmes(channel, schedules):
+            writer.programme(*programme)
+    writer.end()
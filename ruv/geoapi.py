@@ -1,7 +1,11 @@
-import requests
+import os
 
-CHANNEL_STREAM_URL = 'https://geo.spilari.ruv.is/channel/{}'
+from .api import client
+from .trace import span
+
+CHANNEL_STREAM_URL = os.environ.get('RUV_STREAM_URL', 'https://geo.spilari.ruv.is/channel/{}')
 
 def get_channel_stream(chan):
-    res = requests.get(CHANNEL_STREAM_URL.format(chan))
-    return res.json()
+    res = client.get(CHANNEL_STREAM_URL.format(chan), endpoint='channel')
+    with span('json.decode', url=res.url):
+        return res.json()
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import quote, urlsplit
+
+SYNTHETIC_ID = '999999'
+SCALED_LISTS = ('episodes', 'programs', 'events', 'panels')
+SCHEDULE_PATH = re.compile(r'/api/schedule/([^/]+)/(\d{4}-\d{2}-\d{2})/')
+PROGRAM_PATH = re.compile(r'/api/programs/program/([^/]+)/all/')
+
+
+def fixture_name(path):
+    return quote(path.strip('/'), safe='') + '.json'
+
+
+class Recorder:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, resp):
+        try:
+            body = resp.json()
+        except ValueError:
+            return
+        path = urlsplit(resp.request.path_url).path
+        fixture = {'url': resp.url, 'status': resp.status_code, 'body': body}
+        with self._lock:
+            with open(os.path.join(self.directory, fixture_name(path)), 'w') as f:
+                json.dump(fixture, f, ensure_ascii=False)
+
+
+def synthetic_episode(program_id, index):
+    ep_id = f'{program_id}-{index}'
+    return {
+        'id': ep_id,
+        'title': f'Þáttur {index + 1}',
+        'firstrun': (datetime(2020, 1, 1) + timedelta(days=index)).strftime('%Y-%m-%d %H:%M:%S'),
+        'short_description': f'Synthetic episode {index + 1}\nwith a description spanning two lines',
+        'file': f'https://example.invalid/{program_id}/{ep_id}.m3u8',
+        'files': {'hls': f'https://example.invalid/{program_id}/{ep_id}.m3u8'},
+    }
+
+
+def synthetic_program(program_id=SYNTHETIC_ID, episodes=1):
+    return {
+        'id': program_id,
+        'title': f'Synthetic series {program_id}',
+        'foreign_title': 'Synthetic',
+        'short_description': 'A synthetic series served by the mock RUV API',
+        'description': ['A synthetic series served by the mock RUV API'],
+        'multiple_episodes': episodes > 1,
+        'episodes': [synthetic_episode(program_id, i) for i in range(episodes)],
+        'panels': [],
+    }
+
+
+def synthetic_search(query, programs=10):
+    return {
+        'search_query': query,
+        'program_count': programs,
+        'programs': [synthetic_program(str(i), episodes=3) for i in range(programs)],
+    }
+
+
+def synthetic_overview(panels=5):
+    return {'panels': [{
+        'title': f'Panel {i}',
+        'programs': [synthetic_program(f'{i}{j}') for j in range(10)],
+    } for i in range(panels)]}
+
+
+def synthetic_schedule(channel, day, events=40):
+    start = datetime.strptime(day, '%Y-%m-%d').replace(hour=7)
+    return {
+        'title': channel.upper(),
+        'selected_date': day,
+        'events': [{
+            'title': f'Dagskrárliður {i + 1}',
+            'original_title': '',
+            'start_time': (start + timedelta(minutes=25 * i)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'description': [f'Synthetic event {i + 1} on {channel}'],
+            'web_accessible': True,
+            'program': synthetic_program(f'{channel}{i}') if i % 2 else None,
+        } for i in range(events)],
+    }
+
+
+def scale(body, factor):
+    if factor == 1 or not isinstance(body, dict):
+        return body
+    body = dict(body)
+    for name in SCALED_LISTS:
+        items = body.get(name)
+        if isinstance(items, list) and items:
+            target = int(len(items) * factor)
+            body[name] = [items[i % len(items)] for i in range(target)]
+    return body
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory=None, port=0, latency=0, jitter=0, error_rate=0, scale=1, episodes=5000, verbose=False):
+        super().__init__(('127.0.0.1', port), Handler)
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.scale = scale
+        self.episodes = episodes
+        self.verbose = verbose
+        self.fixtures = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}/'
+
+    @property
+    def environ(self):
+        return {
+            'RUV_API_URL': self.url + 'api/',
+            'RUV_STREAM_URL': self.url + 'channel/{}',
+        }
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def _fixture(self, path):
+        if path not in self.fixtures:
+            fixture = None
+            if self.directory:
+                try:
+                    with open(os.path.join(self.directory, fixture_name(path))) as f:
+                        fixture = json.load(f)
+                except FileNotFoundError:
+                    pass
+            self.fixtures[path] = fixture
+        return self.fixtures[path]
+
+    def _synthetic(self, path):
+        program = PROGRAM_PATH.fullmatch(path)
+        if program:
+            program_id = program.group(1)
+            return synthetic_program(program_id, self.episodes if program_id == SYNTHETIC_ID else 3)
+        if path == '/api/programs/featured/tv/':
+            return synthetic_overview()
+        schedule = SCHEDULE_PATH.fullmatch(path)
+        if schedule:
+            return synthetic_schedule(*schedule.groups())
+        if path.startswith(('/api/programs/search/tv/', '/api/programs/category/tv/')):
+            return synthetic_search(path.rsplit('/', 1)[-1])
+        return None
+
+    def resolve(self, path):
+        fixture = self._fixture(path)
+        if fixture is not None:
+            return fixture['status'], scale(fixture['body'], self.scale)
+        body = self._synthetic(path)
+        if body is None:
+            return 404, {'error': 'No fixture for path', 'path': path}
+        return 200, scale(body, self.scale)
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = 'MockRUV/1.0'
+
+    def do_GET(self):
+        server = self.server
+        delay = server.latency + random.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < server.error_rate:
+            self._send(503, {'error': 'Injected failure'})
+            return
+        self._send(*server.resolve(urlsplit(self.path).path))
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+
+def record(args):
+    from . import CHANNEL_NAMES, RADIO_NAMES, RADIO_ALIASES
+    from . import api
+    from .geoapi import get_channel_stream
+
+    api.client.recorder = Recorder(args.directory)
+    api.featured()
+    for query in args.query:
+        results = api.search(query)
+        for program in (results.programs or [])[:args.programs]:
+            api.program_details(program.id)
+    for channel in CHANNEL_NAMES:
+        for offset in range(args.days):
+            api.schedule(channel, date.today() - timedelta(days=offset))
+    for category in args.category:
+        api.category(category)
+    for channel in CHANNEL_NAMES + [RADIO_ALIASES.get(r, r) for r in RADIO_NAMES]:
+        get_channel_stream(channel)
+    print(f"Fixtures recorded to '{args.directory}'")
+
+
+def serve(args):
+    server = MockServer(args.directory, args.port, args.latency, args.jitter, args.error_rate,
+            args.scale, args.episodes, verbose=True)
+    print(f'Serving mock RUV API on {server.url}')
+    for name, value in server.environ.items():
+        print(f'export {name}={value}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record and replay the RUV API', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers()
+
+    record_parser = subparsers.add_parser('record', help='Record responses from the real RUV API')
+    record_parser.add_argument('directory', metavar='DIR', help='Directory to write fixtures to')
+    record_parser.add_argument('-q', '--query', action='append', default=[], help='Search query to record, may be repeated')
+    record_parser.add_argument('-c', '--category', action='append', default=[], help='Category to record, may be repeated')
+    record_parser.add_argument('--programs', type=int, default=5, help='Details recorded for this many programs per search')
+    record_parser.add_argument('--days', type=int, default=1, help='Days of schedule recorded per channel, counting back from today')
+    record_parser.set_defaults(func=record)
+
+    serve_parser = subparsers.add_parser('serve', help='Serve recorded fixtures')
+    serve_parser.add_argument('directory', metavar='DIR', nargs='?', help='Directory to read fixtures from')
+    serve_parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    serve_parser.add_argument('--latency', type=float, default=0, help='Mean response latency in seconds')
+    serve_parser.add_argument('--jitter', type=float, default=0, help='Latency jitter in seconds')
+    serve_parser.add_argument('--error-rate', type=float, default=0, help='Fraction of requests answered with a 503')
+    serve_parser.add_argument('--scale', type=float, default=1, help='Factor applied to the length of lists in payloads')
+    serve_parser.add_argument('--episodes', type=int, default=5000, help=f'Number of episodes of the synthetic series (id {SYNTHETIC_ID})')
+    serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.print_help()
+    else:
+        args.func(args)
+
+if __name__ == '__main__':
+    main()
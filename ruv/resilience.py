@@ -0,0 +1,323 @@
+import random
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, ConnectionError, HTTPError, Timeout
+
+from .parallel import background
+from .trace import span
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 5
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+LATENCY_SAMPLES = 100
+MIN_LATENCY_SAMPLES = 10
+CACHE_SIZE = 256
+POOL_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+
+
+class CircuitOpenError(ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Half open: let a single trial request through per reset period
+            self.opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    def __init__(self, size=LATENCY_SAMPLES, min_samples=MIN_LATENCY_SAMPLES):
+        self.size = size
+        self.min_samples = min_samples
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds):
+        with self._lock:
+            self.samples.setdefault(endpoint, deque(maxlen=self.size)).append(seconds)
+
+    def p95(self, endpoint):
+        with self._lock:
+            samples = sorted(self.samples.get(endpoint, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill()
+            # Reserve a token, going into debt if needed, and wait until it is paid off
+            self.tokens -= 1
+            delay = -self.tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after(resp):
+    try:
+        return min(float(resp.headers.get('Retry-After', 0)), BACKOFF_CAP)
+    except ValueError:
+        return 0
+
+
+def is_outage(error):
+    if isinstance(error, HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUSES
+    return isinstance(error, (ConnectionError, Timeout))
+
+
+def _close(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class Client:
+    def __init__(self, timeout=10, timeouts=None, retries=3, hedge=True, rate=None, burst=1):
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.retries = retries
+        self.hedge = hedge
+        # One breaker per host, so that an outage of one does not fail
+        # requests to the others
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.latency = LatencyTracker()
+        self.bucket = TokenBucket(rate, burst)
+        self.recorder = None
+        self.disk = None
+        self.cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Shared by all threads, so that connections are kept alive across requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def breaker_for(self, url):
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker()
+            return self.breakers[host]
+
+    def timeout_for(self, endpoint):
+        return self.timeouts.get(endpoint, self.timeout)
+
+    def _timed_get(self, url, endpoint, stream=False):
+        start = time.monotonic()
+        with span('http.get', url=url, endpoint=endpoint) as info:
+            resp = self.session.get(url, timeout=self.timeout_for(endpoint), stream=stream)
+            info.update(status=resp.status_code, headers_ms=resp.elapsed.total_seconds() * 1000)
+            if not stream:
+                info.update(bytes=len(resp.content))
+        self.latency.record(endpoint, time.monotonic() - start)
+        if self.recorder:
+            self.recorder.save(resp)
+        return resp
+
+    def _hedged_get(self, url, endpoint, stream):
+        self.bucket.acquire()
+        delay = self.hedge and self.latency.p95(endpoint)
+        if not delay:
+            return self._timed_get(url, endpoint, stream)
+        # Requests get a thread each, so that queueing does not count as latency
+        pending = {background(self._timed_get, url, endpoint, stream)}
+        done, pending = wait(pending, timeout=delay)
+        # Hedging is skipped rather than waited for when rate limited
+        if not done and self.bucket.try_acquire():
+            pending.add(background(self._timed_get, url, endpoint, stream))
+        error = winner = None
+        while done or pending:
+            for future in done:
+                if future.exception() is None and winner is None:
+                    winner = future
+                elif future.exception() is None:
+                    _close(future)
+                else:
+                    error = future.exception()
+            if winner is not None:
+                # The losing request is released once it completes
+                for future in pending:
+                    future.add_done_callback(_close)
+                return winner.result()
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        raise error
+
+    def get(self, url, endpoint=None, stream=False):
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f'{urlsplit(url).netloc} is unavailable, not requesting {url}')
+        for attempt in range(self.retries + 1):
+            error = resp = None
+            try:
+                resp = self._hedged_get(url, endpoint, stream)
+            except (ConnectionError, Timeout) as e:
+                error = e
+            else:
+                if resp.status_code not in RETRY_STATUSES:
+                    breaker.success()
+                    return resp
+            if attempt < self.retries:
+                delay = backoff(attempt)
+                if resp is not None:
+                    delay = max(delay, retry_after(resp))
+                time.sleep(delay)
+        breaker.failure()
+        if error is not None:
+            raise error
+        return resp
+
+    def _cached(self, url):
+        # Used during outages, when any earlier response is better than none,
+        # however old the one on disk is
+        with self._cache_lock:
+            payload = self.cache.get(url)
+        if payload is None and self.disk:
+            payload = self.disk.get(url, stale=True)
+        return payload
+
+    def _store(self, url, payload):
+        with self._cache_lock:
+            self.cache[url] = payload
+            self.cache.move_to_end(url)
+            while len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    def get_json(self, url, endpoint=None, persist=False):
+        if persist and self.disk:
+            payload = self.disk.get(url)
+            if payload is not None:
+                return payload
+        try:
+            resp = self.get(url, endpoint)
+            resp.raise_for_status()
+            with span('json.decode', url=url):
+                payload = resp.json()
+        except RequestException as e:
+            cached = self._cached(url)
+            if cached is None or not is_outage(e):
+                raise
+            return cached
+        self._store(url, payload)
+        if persist and self.disk:
+            self.disk.put(url, payload)
+        return payload
+
+    def iter_json(self, url, parser, endpoint=None):
+        try:
+            resp = self.get(url, endpoint, stream=True)
+            resp.raise_for_status()
+        except RequestException as e:
+            cached = self._cached(url)
+            if cached is None or not is_outage(e):
+                raise
+            yield from parser.replay(cached)
+            return
+        items = []
+        received = 0
+        with span('json.stream', url=url) as info:
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                received += len(chunk)
+                info.update(bytes=received)
+                for item in parser.feed(chunk):
+                    items.append(item)
+                    yield item
+            for item in parser.close():
+                items.append(item)
+                yield item
+        self._store(url, dict(parser.fields, **{parser.key: items}))
@@ -0,0 +1,217 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from .models import Episode, Program, ProgramDetails
+
+# Layout, all integers little endian u32:
+#   header, string table, program records, episode records,
+#   program id index, episode id index, program title index
+# Strings are referenced by (offset, length) into the string table. Indexes
+# are arrays of record numbers, sorted by the UTF-8 bytes of their key.
+MAGIC = b'RUVSNAP1'
+HEADER = struct.Struct('<8s8I')
+PROGRAM = struct.Struct('<15I')
+EPISODE = struct.Struct('<11I')
+INDEX = struct.Struct('<I')
+
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+
+    def add(self, text):
+        encoded = (text or '').encode()
+        if encoded not in self.offsets:
+            self.offsets[encoded] = len(self.data)
+            self.data += encoded
+        return self.offsets[encoded], len(encoded)
+
+
+def _text(value):
+    if isinstance(value, list):
+        return '\n'.join(value)
+    return str(value) if value is not None else ''
+
+
+def write(path, programs):
+    # programs are Program or ProgramDetails models, with their episodes
+    strings = StringTable()
+    program_records = []
+    episode_records = []
+    program_keys = []
+    episode_keys = []
+    title_keys = []
+    for number, program in enumerate(programs):
+        episodes = getattr(program, 'episodes', None) or []
+        title = getattr(program, 'title', None) or ''
+        program_records.append(PROGRAM.pack(
+            *strings.add(str(program.id)),
+            *strings.add(title),
+            *strings.add(title.casefold()),
+            *strings.add(getattr(program, 'foreign_title', None)),
+            *strings.add(getattr(program, 'short_description', None)),
+            *strings.add(_text(getattr(program, 'description', None))),
+            bool(getattr(program, 'multiple_episodes', len(episodes) > 1)),
+            len(episode_records),
+            len(episodes),
+        ))
+        program_keys.append((str(program.id).encode(), number))
+        title_keys.append((title.casefold().encode(), number))
+        for episode in episodes:
+            episode_keys.append((str(episode.id).encode(), len(episode_records)))
+            episode_records.append(EPISODE.pack(
+                *strings.add(str(episode.id)),
+                *strings.add(getattr(episode, 'title', None)),
+                *strings.add(_text(getattr(episode, 'firstrun', None))),
+                *strings.add(getattr(episode, 'short_description', None)),
+                *strings.add(getattr(episode, 'file', None)),
+                number,
+            ))
+
+    sections = [
+        bytes(strings.data),
+        b''.join(program_records),
+        b''.join(episode_records),
+        b''.join(INDEX.pack(n) for _, n in sorted(program_keys)),
+        b''.join(INDEX.pack(n) for _, n in sorted(episode_keys)),
+        b''.join(INDEX.pack(n) for _, n in sorted(title_keys)),
+    ]
+    offsets = []
+    offset = HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = HEADER.pack(MAGIC, len(program_records), len(episode_records), *offsets)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    os.replace(f.name, path)
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.program_count, self.episode_count, self.strings, self.programs,
+                self.episodes, self.program_ids, self.episode_ids, self.titles) = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"'{path}' is not a catalog snapshot")
+
+    @classmethod
+    def open(cls, path, max_age=None):
+        try:
+            if max_age is not None and time.time() - os.path.getmtime(path) > max_age:
+                return None
+            return cls(path)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def close(self):
+        self.map.close()
+
+    def _bytes(self, offset, length):
+        start = self.strings + offset
+        return self.map[start:start + length]
+
+    def _string(self, offset, length):
+        return self._bytes(offset, length).decode()
+
+    def _index(self, index, number):
+        return INDEX.unpack_from(self.map, index + number * INDEX.size)[0]
+
+    def _program_record(self, number):
+        return PROGRAM.unpack_from(self.map, self.programs + number * PROGRAM.size)
+
+    def _episode_record(self, number):
+        return EPISODE.unpack_from(self.map, self.episodes + number * EPISODE.size)
+
+    def _lower_bound(self, index, count, key_of, key):
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_of(self._index(index, mid)) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _program_id(self, number):
+        return self._bytes(*self._program_record(number)[0:2])
+
+    def _program_title(self, number):
+        return self._bytes(*self._program_record(number)[4:6])
+
+    def _episode_id(self, number):
+        return self._bytes(*self._episode_record(number)[0:2])
+
+    def _find(self, index, count, key_of, key):
+        key = str(key).encode()
+        position = self._lower_bound(index, count, key_of, key)
+        if position < count:
+            number = self._index(index, position)
+            if key_of(number) == key:
+                return number
+        return None
+
+    def _episode_dict(self, number):
+        record = self._episode_record(number)
+        return {
+            'id': self._string(*record[0:2]),
+            'title': self._string(*record[2:4]),
+            'firstrun': self._string(*record[4:6]),
+            'short_description': self._string(*record[6:8]),
+            'file': self._string(*record[8:10]),
+            'files': {},
+        }
+
+    def _program_dict(self, number):
+        record = self._program_record(number)
+        first, count = record[13:15]
+        description = self._string(*record[10:12])
+        return {
+            'id': self._string(*record[0:2]),
+            'title': self._string(*record[2:4]),
+            'foreign_title': self._string(*record[6:8]) or None,
+            'short_description': self._string(*record[8:10]),
+            'description': description.splitlines() if description else None,
+            'multiple_episodes': bool(record[12]),
+            'episodes': [self._episode_dict(n) for n in range(first, first + count)],
+        }
+
+    def program(self, program_id, model=Program):
+        number = self._find(self.program_ids, self.program_count, self._program_id, program_id)
+        if number is None:
+            return None
+        return model(self._program_dict(number))
+
+    def details(self, program_id):
+        return self.program(program_id, model=ProgramDetails)
+
+    def episode(self, episode_id):
+        # Returns the id of the episode's program along with the episode
+        number = self._find(self.episode_ids, self.episode_count, self._episode_id, episode_id)
+        if number is None:
+            return None, None
+        program_id = self._string(*self._program_record(self._episode_record(number)[10])[0:2])
+        return program_id, Episode(self._episode_dict(number))
+
+    def search(self, prefix, limit=None):
+        key = prefix.casefold().encode()
+        position = self._lower_bound(self.titles, self.program_count, self._program_title, key)
+        results = []
+        while position < self.program_count and (limit is None or len(results) < limit):
+            number = self._index(self.titles, position)
+            if not self._program_title(number).startswith(key):
+                break
+            results.append(Program(self._program_dict(number)))
+            position += 1
+        return results
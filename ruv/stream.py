@@ -0,0 +1,118 @@
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+START, KEY, COLON, VALUE, COMMA, ARRAY, ARRAY_COMMA, DONE = range(8)
+NOTHING = object()
+
+decoder = json.JSONDecoder()
+
+
+class Incomplete(Exception):
+    pass
+
+
+class StreamParser:
+    # Parses a JSON object incrementally, yielding the elements of the array
+    # under `key` as soon as each is complete. Other members end up in `fields`.
+    def __init__(self, key):
+        self.key = key
+        self.fields = {}
+        self.state = START
+        self.buffer = ''
+        self.pos = 0
+        self.current_key = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+
+    def _expect(self, chars):
+        char = self.buffer[self.pos]
+        if char not in chars:
+            raise ValueError(f'Expected one of {chars!r} at position {self.pos}, got {char!r}')
+        self.pos += 1
+        return char
+
+    def _decode(self, final):
+        try:
+            value, end = decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            raise Incomplete()
+        # A number at the end of the buffer might continue in the next chunk
+        if end == len(self.buffer) and not final:
+            raise Incomplete()
+        self.pos = end
+        return value
+
+    def _step(self, final):
+        char = self.buffer[self.pos]
+        if self.state == START:
+            self._expect('{')
+            self.state = KEY
+        elif self.state == KEY:
+            if char == '}':
+                self.pos += 1
+                self.state = DONE
+            else:
+                self.current_key = self._decode(final)
+                self.state = COLON
+        elif self.state == COLON:
+            self._expect(':')
+            self.state = VALUE
+        elif self.state == VALUE:
+            if self.current_key == self.key and char == '[':
+                self.pos += 1
+                self.state = ARRAY
+            else:
+                self.fields[self.current_key] = self._decode(final)
+                self.state = COMMA
+        elif self.state == COMMA:
+            self.state = KEY if self._expect(',}') == ',' else DONE
+        elif self.state == ARRAY:
+            if char == ']':
+                self.pos += 1
+                self.state = COMMA
+            else:
+                item = self._decode(final)
+                self.state = ARRAY_COMMA
+                return item
+        elif self.state == ARRAY_COMMA:
+            self.state = ARRAY if self._expect(',]') == ',' else COMMA
+        else:
+            raise ValueError(f'Unexpected data after JSON object at position {self.pos}')
+        return NOTHING
+
+    def _parse(self, final=False):
+        items = []
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                break
+            start = self.pos
+            try:
+                item = self._step(final)
+            except Incomplete:
+                self.pos = start
+                break
+            if item is not NOTHING:
+                items.append(item)
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        return items
+
+    def feed(self, data):
+        self.buffer += self._decoder.decode(data)
+        return self._parse()
+
+    def close(self):
+        self.buffer += self._decoder.decode(b'', final=True)
+        items = self._parse(final=True)
+        if self.state != DONE:
+            raise ValueError('Incomplete JSON object')
+        return items
+
+    def replay(self, payload):
+        self.fields.update((k, v) for k, v in payload.items() if k != self.key)
+        self.state = DONE
+        return list(payload.get(self.key) or [])
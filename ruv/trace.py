@@ -0,0 +1,109 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PROFILE_LIMIT = 25
+
+
+def _field(value):
+    return '-' if value is None else value
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **args):
+        if not self.enabled:
+            yield {}
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append((name, start, end, threading.get_ident(), args))
+
+    def chrome_trace(self):
+        return {'traceEvents': [{
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': args,
+        } for name, start, end, tid, args in self.spans]}
+
+    def summary(self):
+        phases = OrderedDict()
+        for name, start, end, _, _ in sorted(self.spans, key=lambda s: s[1]):
+            count, total, longest = phases.get(name, (0, 0, 0))
+            phases[name] = (count + 1, total + end - start, max(longest, end - start))
+        lines = [f'{"Phase":<24} {"Count":>6} {"Total ms":>10} {"Max ms":>10}']
+        for name, (count, total, longest) in phases.items():
+            lines.append(f'{name:<24} {count:>6} {total * 1000:>10.1f} {longest * 1000:>10.1f}')
+
+        requests = [(start, end, args) for name, start, end, _, args in self.spans if name == 'http.get']
+        # The body of a streamed request is read, and counted, after its http.get span
+        streamed = {args['url']: args.get('bytes') for name, _, _, _, args in self.spans if name == 'json.stream'}
+        if requests:
+            lines.append('')
+            lines.append(f'{"Status":>6} {"Bytes":>10} {"Headers ms":>10} {"Total ms":>10}  URL')
+            for start, end, args in sorted(requests, key=lambda r: r[0]):
+                size = args.get('bytes', streamed.get(args['url']))
+                lines.append(f'{_field(args.get("status")):>6} {_field(size):>10} '
+                        f'{args.get("headers_ms", 0):>10.1f} {(end - start) * 1000:>10.1f}  {args["url"]}')
+        return '\n'.join(lines)
+
+    def write(self, path):
+        if path == '-':
+            print(self.summary(), file=sys.stderr)
+        elif path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump(self.chrome_trace(), f)
+        else:
+            with open(path, 'w') as f:
+                f.write(self.summary() + '\n')
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def profile(func, *args, limit=PROFILE_LIMIT):
+    profilers = [cProfile.Profile()]
+    lock = threading.Lock()
+    # Before 3.12 a profiler only sees the thread that enabled it, so threads
+    # started by the command get one each, merged into the same report
+    per_thread = sys.version_info < (3, 12)
+
+    def start_thread(*_):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    if per_thread:
+        threading.setprofile(start_thread)
+    try:
+        return profilers[0].runcall(func, *args)
+    finally:
+        if per_thread:
+            threading.setprofile(None)
+        with lock:
+            stats = pstats.Stats(*profilers, stream=sys.stderr)
+        stats.sort_stats('tottime').print_stats(limit)
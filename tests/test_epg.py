@@ -0,0 +1,103 @@
+import io
+import os
+import xml.etree.ElementTree as ET
+
+from ruv.cache import DiskCache
+from ruv.epg import write_epg
+from ruv.mockapi import synthetic_schedule
+from ruv.models import Schedule
+
+
+def listings(channels, days=('2020-01-01', '2020-01-02'), events=3):
+    for channel in channels:
+        schedules = [Schedule(synthetic_schedule(channel, day, events=events)) for day in days]
+        schedules[0].events[0].title = 'Fréttir & veður <í beinni>'
+        schedules[0].events[0].description = ['Lína 1; með, táknum\\', 'Lína 2']
+        yield channel, schedules
+
+
+def render(fmt, channels=('ruv', 'ras3')):
+    out = io.StringIO()
+    write_epg(out, fmt, list(channels), listings(channels))
+    return out.getvalue()
+
+
+def test_xmltv_document():
+    tree = ET.fromstring(render('xmltv').encode())
+    assert [c.get('id') for c in tree.iter('channel')] == ['ruv.ruv.is', 'ras3.ruv.is']
+    assert [c.findtext('display-name') for c in tree.iter('channel')] == ['RÚV', 'Rondó']
+
+    programmes = tree.findall('programme')
+    assert len(programmes) == 12
+    first = programmes[0]
+    assert first.get('channel') == 'ruv.ruv.is'
+    assert first.get('start') == '20200101070000 +0000'
+    assert first.get('stop') == '20200101072500 +0000'
+    assert first.findtext('title') == 'Fréttir & veður <í beinni>'
+    assert first.findtext('desc') == 'Lína 1; með, táknum\\\nLína 2'
+
+    # Each day's last event ends when the next day's first one starts
+    assert programmes[2].get('stop') == '20200102070000 +0000'
+    # The very last one has no known end
+    assert programmes[5].get('stop') is None
+
+
+def unfold(text):
+    assert '\n' not in text.replace('\r\n', '')
+    return text.replace('\r\n ', '').split('\r\n')
+
+
+def test_ical_lines_are_folded_and_escaped():
+    text = render('ical')
+    for line in text.split('\r\n'):
+        assert len(line.encode()) <= 75
+
+    lines = unfold(text)
+    assert lines[0] == 'BEGIN:VCALENDAR'
+    assert lines[-2:] == ['END:VCALENDAR', '']
+    assert lines.count('BEGIN:VEVENT') == 12
+    assert 'SUMMARY:Fréttir & veður <í beinni>' in lines
+    assert 'DESCRIPTION:Lína 1\\; með\\, táknum\\\\\\nLína 2' in lines
+
+
+def test_ical_long_lines_fold_on_character_boundaries():
+    channel, schedules = next(listings(['ruv']))
+    schedules[0].events[0].description = ['þ' * 200]
+    out = io.StringIO()
+    write_epg(out, 'ical', ['ruv'], [(channel, schedules)])
+    assert 'DESCRIPTION:' + 'þ' * 200 in unfold(out.getvalue())
+
+
+def test_ical_dtstamp_is_generation_time():
+    lines = unfold(render('ical'))
+    stamps = {line for line in lines if line.startswith('DTSTAMP:')}
+    starts = {line.split(':', 1)[1] for line in lines if line.startswith('DTSTART:')}
+    assert len(stamps) == 1
+    assert stamps.pop().split(':', 1)[1] not in starts
+
+
+def test_disk_cache_entries_expire(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60)
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    assert cache.get('a') == {'n': 1}
+
+    old = os.path.getmtime(cache._path('a')) - 120
+    os.utime(cache._path('a'), (old, old))
+    assert cache.get('a') is None
+    cache.prune()
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(cache._path('b'))]
+
+
+def test_missing_day_closes_the_previous_event():
+    days = ('2020-01-01', '2020-01-02', '2020-01-03')
+    channel, schedules = next(listings(['ruv'], days=days))
+    # The fetch of the middle day failed
+    schedules[1] = None
+    out = io.StringIO()
+    write_epg(out, 'xmltv', ['ruv'], [(channel, schedules)])
+    programmes = ET.fromstring(out.getvalue().encode()).findall('programme')
+    assert len(programmes) == 6
+    assert programmes[2].get('start') == '20200101075000 +0000'
+    assert programmes[2].get('stop') is None
+    assert programmes[3].get('start') == '20200103070000 +0000'
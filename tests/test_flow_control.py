@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+from datetime import timedelta
+
+from ruv import api
+from ruv.choose import ItemSource
+from ruv.mockapi import synthetic_program
+from ruv.resilience import Client, SingleFlight, TokenBucket
+
+
+def test_single_flight_shares_one_call():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(1)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('key', slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+
+
+def test_single_flight_shares_errors_and_forgets_the_call():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(1)
+        raise ValueError('boom')
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 3
+    assert flights.do('key', lambda: 'fresh') == 'fresh'
+
+
+def test_token_bucket_limits_bursts():
+    bucket = TokenBucket(rate=0.001, burst=2)
+    assert bucket.try_acquire()
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_token_bucket_without_rate_never_blocks():
+    bucket = TokenBucket(rate=None, burst=1)
+    assert all(bucket.try_acquire() for _ in range(100))
+
+
+class StreamedResponse:
+    status_code = 200
+    headers = {}
+    elapsed = timedelta()
+
+    def __init__(self, body, release):
+        self.body = body
+        self.release = release
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        yield self.body[:20]
+        self.release.wait(1)
+        yield self.body[20:]
+
+    def close(self):
+        pass
+
+
+def test_concurrent_streams_of_a_url_share_one_request(monkeypatch):
+    release = threading.Event()
+    programs = [synthetic_program(str(n), episodes=1) for n in range(3)]
+    body = json.dumps({'programs': programs, 'category': 'x'}).encode()
+
+    class Session:
+        calls = 0
+
+        def get(self, url, timeout=None, stream=False):
+            self.calls += 1
+            return StreamedResponse(body, release)
+
+    client = Client(retries=0, hedge=False)
+    client.session = Session()
+    monkeypatch.setattr(api, 'client', client)
+
+    first = api.category_stream('x')
+    second = api.category_stream('x')
+    assert first is second
+    sources = [ItemSource(first), ItemSource(second)]
+    time.sleep(0.05)
+    release.set()
+    for source in sources:
+        source.join()
+        assert [program.id for program in source.items] == ['0', '1', '2']
+    assert client.session.calls == 1
+    assert first.result.category == 'x'
+
+    # Once finished, the next call makes a new request
+    third = api.category_stream('x')
+    assert third is not first
+    assert [program.id for program in third] == ['0', '1', '2']
+    assert client.session.calls == 2
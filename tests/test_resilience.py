@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from requests.exceptions import ConnectionError, HTTPError
+
+from ruv import resilience
+from ruv.cache import DiskCache
+from ruv.resilience import CircuitBreaker, CircuitOpenError, Client
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = {}
+        self.content = b''
+        self.elapsed = timedelta()
+        self.closed = False
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(response=self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, timeout=None, stream=False):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, 'backoff', lambda attempt: 0)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    # A single trial request is let through once the reset timeout passes
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.success()
+    assert not breaker.is_open
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_trial_fails():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.failure()
+    assert not breaker.allow()
+
+
+def test_client_retries_retryable_statuses():
+    client = Client(retries=2, hedge=False)
+    client.session = FakeSession(FakeResponse(503), FakeResponse(200, {'ok': True}))
+    assert client.get_json('http://api/x') == {'ok': True}
+    assert client.session.calls == 2
+
+
+def test_client_opens_circuit_after_failures():
+    client = Client(retries=0, hedge=False)
+    client.breakers['api'] = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    client.session = FakeSession(ConnectionError(), ConnectionError(), FakeResponse(200))
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            client.get('http://api/x')
+    with pytest.raises(CircuitOpenError):
+        client.get('http://api/x')
+    assert client.session.calls == 2
+    # Other hosts have breakers of their own
+    assert client.get('http://geo/x').status_code == 200
+
+
+def test_client_falls_back_to_cache_during_outage():
+    client = Client(retries=0, hedge=False)
+    client.session = FakeSession(FakeResponse(200, {'n': 1}), FakeResponse(503))
+    assert client.get_json('http://api/x') == {'n': 1}
+    assert client.get_json('http://api/x') == {'n': 1}
+
+
+def test_client_falls_back_to_disk_cache_during_outage(tmp_path):
+    client = Client(retries=0, hedge=False)
+    client.disk = DiskCache(str(tmp_path), max_age=60)
+    client.disk.put('http://api/x', {'n': 1})
+    old = os.path.getmtime(client.disk._path('http://api/x')) - 120
+    os.utime(client.disk._path('http://api/x'), (old, old))
+    client.session = FakeSession(FakeResponse(503))
+    # Even an expired entry is served while the API is down
+    assert client.get_json('http://api/x') == {'n': 1}
+
+
+def test_client_does_not_hide_client_errors_behind_cache():
+    client = Client(retries=0, hedge=False)
+    client.session = FakeSession(FakeResponse(200, {'n': 1}), FakeResponse(404))
+    client.get_json('http://api/x')
+    with pytest.raises(HTTPError):
+        client.get_json('http://api/x')
+
+
+def test_hedged_request_returns_first_response_and_closes_the_other():
+    client = Client(retries=0, hedge=True)
+    for _ in range(resilience.MIN_LATENCY_SAMPLES):
+        client.latency.record('slow', 0.01)
+    slow, fast = FakeResponse(200, 'slow'), FakeResponse(200, 'fast')
+    release = threading.Event()
+
+    class Session:
+        calls = 0
+
+        def get(self, url, timeout=None, stream=False):
+            self.calls += 1
+            if self.calls == 1:
+                release.wait(1)
+                return slow
+            return fast
+
+    client.session = Session()
+    assert client.get('http://api/x', endpoint='slow') is fast
+    release.set()
+    for _ in range(100):
+        if slow.closed:
+            break
+        time.sleep(0.01)
+    assert slow.closed
+    assert not fast.closed
+
+
+def test_trace_summary_counts_streamed_bytes(monkeypatch):
+    from ruv.stream import StreamParser
+    from ruv.trace import Tracer
+
+    tracer = Tracer()
+    tracer.enabled = True
+    monkeypatch.setattr(resilience, 'span', tracer.span)
+    body = b'{"title": "x", "episodes": [1, 2, 3]}'
+    response = FakeResponse(200)
+    response.iter_content = lambda size: [body[:10], body[10:]]
+
+    client = Client(retries=0, hedge=False)
+    client.session = FakeSession(response, FakeResponse(200, {}))
+    assert list(client.iter_json('http://api/s', StreamParser('episodes'))) == [1, 2, 3]
+    # A status is missing from this span, which must not break the summary
+    with tracer.span('http.get', url='http://api/unknown'):
+        pass
+
+    rows = [row.split() for row in tracer.summary().splitlines() if row.endswith('http://api/s')]
+    assert rows and rows[0][1] == str(len(body))
+    rows = [row.split() for row in tracer.summary().splitlines() if row.endswith('http://api/unknown')]
+    assert rows and rows[0][:2] == ['-', '-']
+ 
\ No newline at end of file
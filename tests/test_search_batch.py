@@ -0,0 +1,96 @@
+import io
+import sys
+import threading
+import time
+from argparse import Namespace
+
+import pytest
+
+import ruv
+from ruv.mockapi import synthetic_program
+from ruv.models import Program, ProgramDetails, SearchResults
+
+
+def program(program_id, title, episodes=1):
+    result = Program(synthetic_program(program_id, episodes=episodes))
+    result.title = title
+    return result
+
+
+@pytest.fixture
+def api(monkeypatch):
+    # Searches for 'slow' take longest, so that they finish last
+    results = {
+        'slow': [program('1', 'Kastljós')],
+        'news': [program('2', 'Fréttir'), program('1', 'Kastljós')],
+        'again': [program('1', 'Kastljós')],
+        'nothing': [],
+    }
+    calls = {'search': [], 'program_details': []}
+    lock = threading.Lock()
+
+    def search(query):
+        with lock:
+            calls['search'].append(query)
+        time.sleep(0.1 if query == 'slow' else 0)
+        found = SearchResults({'programs': [], 'program_count': len(results[query])})
+        found.programs = results[query]
+        return found
+
+    def program_details(program_id):
+        with lock:
+            calls['program_details'].append(program_id)
+        time.sleep(0.05)
+        return ProgramDetails(synthetic_program(program_id, episodes=3))
+
+    monkeypatch.setattr(ruv.api, 'search', search)
+    monkeypatch.setattr(ruv.api, 'program_details', program_details)
+    return calls
+
+
+def run(tmp_path, capsys, queries, offset=0, jobs=4):
+    path = tmp_path / 'queries.txt'
+    path.write_text(queries)
+    ruv.search_batch(Namespace(batch=str(path), jobs=jobs, offset=offset))
+    return [line.split('\t') for line in capsys.readouterr().out.splitlines()]
+
+
+def test_results_are_printed_in_input_order(api, tmp_path, capsys):
+    rows = run(tmp_path, capsys, 'slow\n\nnews\n  nothing  \n')
+    assert [row[0] for row in rows] == ['slow', 'news', 'nothing']
+    assert rows[0][1:3] == ['1', 'Kastljós']
+    assert rows[1][1:3] == ['2', 'Fréttir']
+    assert rows[2] == ['nothing', '', '', '', '']
+    assert all(len(row) == 5 for row in rows)
+
+
+def test_offset_applies_to_each_query(api, tmp_path, capsys):
+    rows = run(tmp_path, capsys, 'slow\nnews\n', offset=1)
+    assert [row[3] for row in rows] == ['1-1', '2-1']
+    assert sorted(api['program_details']) == ['1', '2']
+
+    # An offset past the last episode gives the oldest one
+    rows = run(tmp_path, capsys, 'slow\n', offset=10)
+    assert rows[0][3] == '1-2'
+
+
+def test_episodes_are_fetched_once_per_program(api, tmp_path, capsys):
+    rows = run(tmp_path, capsys, 'slow\nagain\nslow\n', offset=1)
+    assert [row[1] for row in rows] == ['1', '1', '1']
+    assert api['program_details'] == ['1']
+    assert len(api['search']) == 3
+
+
+def test_missing_batch_file_is_reported(tmp_path, capsys):
+    ruv.search_batch(Namespace(batch=str(tmp_path / 'missing.txt'), jobs=1, offset=0))
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'missing.txt' in captured.err
+
+
+def test_stdin_is_left_open(api, monkeypatch, capsys):
+    stdin = io.StringIO('news\n')
+    monkeypatch.setattr(sys, 'stdin', stdin)
+    ruv.search_batch(Namespace(batch='-', jobs=1, offset=0))
+    assert capsys.readouterr().out.startswith('news\t2\t')
+    assert not stdin.closed
@@ -0,0 +1,75 @@
+import os
+
+from ruv.mockapi import synthetic_program
+from ruv.models import Program, ProgramDetails
+from ruv.snapshot import Snapshot, write
+
+
+def programs():
+    series = ProgramDetails(synthetic_program('100', episodes=4))
+    series.title = 'Kastljós'
+    series.description = ['Fyrsta lína', 'Önnur lína']
+    single = Program(synthetic_program('200', episodes=1))
+    single.title = 'Áramótaskaup'
+    single.foreign_title = None
+    other = Program(synthetic_program('300', episodes=2))
+    other.title = 'Kastljós aukaþáttur'
+    empty = Program(synthetic_program('400', episodes=0))
+    empty.title = 'Ekkert'
+    return [series, single, other, empty]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    originals = programs()
+    write(path, originals)
+    snapshot = Snapshot(path)
+
+    for original in originals:
+        program = snapshot.details(original.id)
+        assert program.id == original.id
+        assert program.title == original.title
+        assert program.foreign_title == original.foreign_title
+        assert program.short_description == original.short_description
+        assert [ep.id for ep in program.episodes] == [ep.id for ep in original.episodes]
+        assert [ep.file for ep in program.episodes] == [ep.file for ep in original.episodes]
+        assert [ep.title for ep in program.episodes] == [ep.title for ep in original.episodes]
+    assert snapshot.details('100').description == ['Fyrsta lína', 'Önnur lína']
+    assert snapshot.program('999') is None
+
+
+def test_episode_lookup(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    write(path, programs())
+    snapshot = Snapshot(path)
+
+    program_id, episode = snapshot.episode('100-2')
+    assert program_id == '100'
+    assert episode.file == 'https://example.invalid/100/100-2.m3u8'
+    assert snapshot.episode('100-9') == (None, None)
+
+
+def test_search_by_title_prefix(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    write(path, programs())
+    snapshot = Snapshot(path)
+
+    assert [p.title for p in snapshot.search('kastljós')] == ['Kastljós', 'Kastljós aukaþáttur']
+    assert [p.title for p in snapshot.search('KASTLJÓS', limit=1)] == ['Kastljós']
+    assert [p.title for p in snapshot.search('ára')] == ['Áramótaskaup']
+    assert snapshot.search('zzz') == []
+
+
+def test_open_rejects_stale_and_invalid_files(tmp_path):
+    path = str(tmp_path / 'catalog.snap')
+    assert Snapshot.open(path) is None
+
+    write(path, programs())
+    assert Snapshot.open(path, max_age=60) is not None
+    old = os.path.getmtime(path) - 120
+    os.utime(path, (old, old))
+    assert Snapshot.open(path, max_age=60) is None
+
+    invalid = tmp_path / 'invalid.snap'
+    invalid.write_bytes(b'not a snapshot at all, just some bytes here')
+    assert Snapshot.open(str(invalid)) is None
@@ -0,0 +1,72 @@
+import json
+import random
+
+import pytest
+
+from ruv.stream import StreamParser
+
+PAYLOADS = [
+    {'id': 1, 'title': 'Kastljós', 'episodes': [{'id': 'a', 'title': 'Þáttur 1'}, {'id': 'b', 'files': {'hls': 'x'}}], 'panels': []},
+    {'episodes': [], 'title': 'Tómt'},
+    {'programs': [{'title': 'Nested [ ] { } , : "quoted"'}, 1, 'two', None, True, [1, [2]]], 'count': 6},
+    {'title': 'No list'},
+    {'episodes': [{'description': ['Lína 1', 'Lína 2 ✓'], 'n': -1.5e3}] * 50, 'after': {'deep': [1, 2, 3]}},
+]
+
+
+def parse(payload, key, cuts, indent=None):
+    data = json.dumps(payload, ensure_ascii=False, indent=indent).encode()
+    parser = StreamParser(key)
+    items = []
+    start = 0
+    for cut in sorted(cuts) + [len(data)]:
+        items.extend(parser.feed(data[start:cut]))
+        start = cut
+    items.extend(parser.close())
+    return parser.fields, items
+
+
+def expected(payload, key):
+    fields = {k: v for k, v in payload.items() if k != key}
+    return fields, payload.get(key, [])
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+def test_every_single_split(payload):
+    key = 'programs' if 'programs' in payload else 'episodes'
+    size = len(json.dumps(payload, ensure_ascii=False).encode())
+    for cut in range(size + 1):
+        assert parse(payload, key, [cut]) == expected(payload, key)
+
+
+@pytest.mark.parametrize('payload', PAYLOADS)
+@pytest.mark.parametrize('indent', [None, 2])
+def test_random_chunk_boundaries(payload, indent):
+    key = 'programs' if 'programs' in payload else 'episodes'
+    rng = random.Random(0)
+    size = len(json.dumps(payload, ensure_ascii=False, indent=indent).encode())
+    for _ in range(200):
+        cuts = rng.sample(range(size + 1), rng.randint(0, min(size, 30)))
+        assert parse(payload, key, cuts, indent) == expected(payload, key)
+
+
+def test_items_are_yielded_before_the_end():
+    data = json.dumps({'episodes': [{'id': i} for i in range(3)], 'title': 't'}).encode()
+    parser = StreamParser('episodes')
+    first = parser.feed(data[:data.index(b'{"id": 1}') + 1])
+    assert first == [{'id': 0}]
+
+
+@pytest.mark.parametrize('data', [b'{"episodes": [1, 2', b'{"title": "x"', b'[1, 2]', b'{"a": 1} trailing'])
+def test_malformed_input_raises(data):
+    parser = StreamParser('episodes')
+    with pytest.raises(ValueError):
+        parser.feed(data)
+        parser.close()
+
+
+def test_replay_matches_streamed_result():
+    payload = PAYLOADS[0]
+    parser = StreamParser('episodes')
+    assert parser.replay(payload) == payload['episodes']
+    assert parser.fields == expected(payload, 'episodes')[0]